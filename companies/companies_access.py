@@ -16,6 +16,12 @@ class CompaniesDatabaseInterface(abc.ABC):
         Get information about a company by its CNPJ.
         """
 
+    @abc.abstractmethod
+    def get_companies(self, cnpjs: list = []):
+        """
+        Get information about several companies by their CNPJs in one query.
+        """
+
     @abc.abstractmethod
     def get_partners(self, cnpj: str = ""):
         """
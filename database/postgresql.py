@@ -1,226 +1,485 @@
+import copy
 import logging
 import re
-from typing import Any, Dict, Iterable, List, Tuple, Union
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter, mul
+from typing import Any, ClassVar, Dict, Iterable, Iterator, List, Tuple, Union
 
 import psycopg2
+import psycopg2.pool
 
 from companies import Company, InvalidCNPJException, Partner, CompaniesDatabaseInterface
 
 
+logger = logging.getLogger(__name__)
+
+PREPARED_STATEMENTS = {
+    "get_company_stmt": """
+        SELECT
+            *
+        FROM
+            resposta_cnpj
+        WHERE
+            estabelecimento_cnpj_basico = $1
+            AND estabelecimento_cnpj_ordem = $2
+            AND estabelecimento_cnpj_dv = $3
+    """,
+    "get_partners_stmt": """
+        SELECT
+            *
+        FROM
+            resposta_socios
+        WHERE
+            cnpj_basico = $1
+    """,
+}
+
+# Position of each Company/Partner attribute in the rows returned by the
+# prepared statements above, listed in the order the constructors expect them
+COMPANY_COLUMNS = (
+    ("identificador_matriz_filial", 4),
+    ("nome_fantasia", 5),
+    ("situacao_cadastral", 6),
+    ("data_situacao_cadastral", 7),
+    ("motivo_situacao_cadastral", 8),
+    ("nome_cidade_exterior", 9),
+    ("data_inicio_atividade", 10),
+    ("cnae_fiscal_secundario", 11),
+    ("tipo_logradouro", 12),
+    ("logradouro", 13),
+    ("numero", 14),
+    ("complemento", 15),
+    ("bairro", 16),
+    ("cep", 17),
+    ("uf", 18),
+    ("ddd_telefone_1", 19),
+    ("ddd_telefone_2", 20),
+    ("ddd_telefone_fax", 21),
+    ("correio_eletronico", 22),
+    ("situacao_especial", 23),
+    ("data_situacao_especial", 24),
+    ("pais", 38),
+    ("municipio", 39),
+    ("razao_social", 25),
+    ("natureza_juridica", 26),
+    ("qualificacao_do_responsavel", 27),
+    ("capital_social", 28),
+    ("porte", 29),
+    ("ente_federativo_responsavel", 30),
+    ("opcao_pelo_simples", 31),
+    ("data_opcao_pelo_simples", 32),
+    ("data_exclusao_pelo_simples", 33),
+    ("opcao_pelo_mei", 34),
+    ("data_opcao_pelo_mei", 35),
+    ("data_exclusao_pelo_mei", 36),
+    ("cnae", 37),
+)
+PARTNER_COLUMNS = (
+    ("identificador_socio", 2),
+    ("razao_social", 3),
+    ("cnpj_cpf_socio", 4),
+    ("qualificacao_socio", 5),
+    ("data_entrada_sociedade", 6),
+    ("pais_socio_estrangeiro", 7),
+    ("numero_cpf_representante_legal", 8),
+    ("nome_representante_legal", 9),
+    ("qualificacao_representante_legal", 10),
+    ("faixa_etaria", 11),
+)
+
+_pick_company_columns = itemgetter(*(index for _, index in COMPANY_COLUMNS))
+_pick_partner_columns = itemgetter(*(index for _, index in PARTNER_COLUMNS))
+
+_NULL_STRINGS = frozenset(("", "None"))
+
+_NON_DIGIT_DELETION_TABLE = str.maketrans(
+    "", "", "".join(chr(code) for code in range(256) if not "0" <= chr(code) <= "9")
+)
+_NON_DIGIT_RE = re.compile(r"[^0-9]")
+
+_FIRST_DV_WEIGHTS = bytes((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2))
+_SECOND_DV_WEIGHTS = bytes((6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3))
+_FIRST_DV_OFFSET = ord("0") * sum(_FIRST_DV_WEIGHTS)
+_SECOND_DV_OFFSET = ord("0") * sum(_SECOND_DV_WEIGHTS)
+
+
+def _always_str_or_none(data: Any) -> Union[str, None]:
+    if data is None:
+        return None
+    elif type(data) is not str:
+        return str(data)
+    elif data in _NULL_STRINGS:
+        return None
+    else:
+        return data
+
+
+@lru_cache(maxsize=4096)
+def _is_valid_cnpj(cnpj: str) -> bool:
+    cnpj_only_digits = _cnpj_only_digits(cnpj)
+    if len(cnpj_only_digits) != 14:
+        return False
+
+    cnpj_without_dv = cnpj_only_digits[:-2]
+    generated_dv = _generate_cnpj_dv(cnpj_without_dv)
+    return cnpj_only_digits[-2:] == generated_dv
+
+
+def _are_valid_cnpjs(cnpjs: Iterable[str]) -> List[bool]:
+    return list(map(_is_valid_cnpj, cnpjs))
+
+
+@lru_cache(maxsize=4096)
+def _cnpj_only_digits(cnpj: str) -> str:
+    only_digits = cnpj.translate(_NON_DIGIT_DELETION_TABLE)
+    if not only_digits.isascii():
+        only_digits = _NON_DIGIT_RE.sub("", only_digits)
+    if only_digits == "":
+        return only_digits
+    else:
+        return only_digits.zfill(14)
+
+
+def _generate_cnpj_dv(cnpj_without_dv: str) -> str:
+    # Weighted sums are taken over the ASCII codes, so the contribution of
+    # ord("0") is subtracted once instead of converting every digit.
+    # (11 - remainder) % 11 % 10 maps remainders 0 and 1 to 0 without a branch.
+    ascii_digits = cnpj_without_dv.encode("ascii")
+    first_sum = sum(map(mul, ascii_digits, _FIRST_DV_WEIGHTS)) - _FIRST_DV_OFFSET
+    first_digit = (11 - first_sum % 11) % 11 % 10
+    second_sum = sum(map(mul, ascii_digits, _SECOND_DV_WEIGHTS)) - _SECOND_DV_OFFSET
+    second_digit = (11 - (second_sum + 2 * first_digit) % 11) % 11 % 10
+    return f"{first_digit}{second_digit}"
+
+
+@lru_cache(maxsize=4096)
+def _canonicalize_cnpj(cnpj: str) -> Tuple[str, str, str, str, str]:
+    """
+    Returns the CNPJ digits, its basico, ordem and dv parts and the formatted
+    CNPJ, all derived from a single digits extraction.
+    """
+    digits = _cnpj_only_digits(cnpj)
+    full_cnpj = f"{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}"
+    return digits, digits[:8], digits[8:12], digits[12:], full_cnpj
+
+
+def _format_full_cnpj(cnpj: str) -> str:
+    return _canonicalize_cnpj(cnpj)[4]
+
+
+def _split_cnpj(cnpj: str) -> Tuple[str, str, str]:
+    return _canonicalize_cnpj(cnpj)[1:4]
+
+
+def _unsplit_cnpj(cnpj_basico: str, cnpj_ordem: str, cnpj_dv: str) -> str:
+    return (
+        f"{str(cnpj_basico).zfill(8)}{str(cnpj_ordem).zfill(4)}{str(cnpj_dv).zfill(2)}"
+    )
+
+
 class PostgreSQLDatabase(CompaniesDatabaseInterface):
-    def __init__(self, host, database, user, password, port):
+    # Gateways created with the same connection settings share one pool, which
+    # is closed when the last of them is closed. The statements prepared on
+    # its connections are tracked for all of them
+    _pools: ClassVar[Dict[Tuple, psycopg2.pool.ThreadedConnectionPool]] = {}
+    _pool_users: ClassVar[Dict[Tuple, int]] = {}
+    _pools_lock: ClassVar[threading.Lock] = threading.Lock()
+    _prepared_statements: ClassVar[weakref.WeakKeyDictionary] = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def __init__(
+        self,
+        host,
+        database,
+        user,
+        password,
+        port,
+        min_connections: int = 1,
+        max_connections: int = 10,
+        company_cache_size: int = 1024,
+        company_cache_ttl: float = 300,
+    ):
         self.host = host
         self.database = database
         self.user = user
         self.password = password
         self.port = port
-
-    def _select(self, command: str, data: Dict = {}) -> Iterable[Tuple]:
-        connection = psycopg2.connect(
+        self._dsn = psycopg2.extensions.make_dsn(
             dbname=self.database,
             user=self.user,
             password=self.password,
             host=self.host,
             port=self.port,
         )
+        self._min_connections = min_connections
+        self._max_connections = max_connections
+        self._pool_key = (self._dsn, min_connections, max_connections)
+        self._closed = False
+        with self._pools_lock:
+            self._pool_users[self._pool_key] = (
+                self._pool_users.get(self._pool_key, 0) + 1
+            )
+        self._company_cache = OrderedDict()
+        self._company_cache_lock = threading.Lock()
+        self._company_cache_size = company_cache_size
+        self._company_cache_ttl = company_cache_ttl
+
+    def close(self) -> None:
+        """
+        Releases this gateway's share of the connection pool. The pool itself
+        is closed when the last gateway using it is closed.
+        """
+        with self._pools_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._pool_users[self._pool_key] -= 1
+            if self._pool_users[self._pool_key] > 0:
+                return
+            del self._pool_users[self._pool_key]
+            pool = self._pools.pop(self._pool_key, None)
+        if pool is not None:
+            pool.closeall()
+
+    def _get_pool(self) -> psycopg2.pool.ThreadedConnectionPool:
+        # The pool is only created, and its first connection opened, when the
+        # gateway runs its first query. The pool keeps at most min_connections
+        # idle connections, so min_connections must be at least 1 for
+        # connections to be reused
+        if self._closed:
+            raise psycopg2.pool.PoolError("connection pool is closed")
+
+        pool = self._pools.get(self._pool_key)
+        if pool is not None:
+            return pool
+
+        with self._pools_lock:
+            if self._pool_key not in self._pools:
+                self._pools[self._pool_key] = psycopg2.pool.ThreadedConnectionPool(
+                    self._min_connections, self._max_connections, self._dsn
+                )
+            return self._pools[self._pool_key]
+
+    @contextmanager
+    def _connection(self) -> Iterator[psycopg2.extensions.connection]:
+        pool = self._get_pool()
+        connection = pool.getconn()
+        discard = False
+        try:
+            yield connection
+            connection.commit()
+        except Exception:
+            # A failed batch of PREPAREs or a stale cached plan would leave the
+            # server-side statements out of sync with _prepared_statements, so
+            # the connection is closed instead of going back to the pool
+            discard = True
+            self._prepared_statements.pop(connection, None)
+            raise
+        finally:
+            pool.putconn(connection, close=discard or bool(connection.closed))
+
+    def _prepare(
+        self, connection: psycopg2.extensions.connection, statements: Iterable[str]
+    ) -> None:
+        prepared = self._prepared_statements.setdefault(connection, set())
+        missing = [statement for statement in statements if statement not in prepared]
+        if not missing:
+            return
+
         with connection.cursor() as cursor:
-            cursor.execute(command, data)
-            logging.debug(f"Starting query: {cursor.query}")
-            for entry in cursor:
-                logging.debug(entry)
-                yield entry
-            logging.debug(f"Finished query: {cursor.query}")
+            cursor.execute(
+                ";".join(
+                    f"PREPARE {statement} AS {PREPARED_STATEMENTS[statement]}"
+                    for statement in missing
+                )
+            )
+        prepared.update(missing)
+
+    def _select(
+        self, command: str, data: Dict = {}, prepared_statements: Tuple[str, ...] = ()
+    ) -> Iterable[Tuple]:
+        yield from self._select_all(command, data, prepared_statements)
+
+    def _select_all(
+        self, command: str, data: Dict = {}, prepared_statements: Tuple[str, ...] = ()
+    ) -> List[Tuple]:
+        with self._connection() as connection:
+            self._prepare(connection, prepared_statements)
+            with connection.cursor() as cursor:
+                cursor.execute(command, data)
+                logger.debug("Starting query: %s", cursor.query)
+                entries = cursor.fetchall()
+                logger.debug("Finished query: %s", cursor.query)
+        if logger.isEnabledFor(logging.DEBUG):
+            for entry in entries:
+                logger.debug("%r", entry)
+        return entries
+
+    def _select_one(
+        self, command: str, data: Dict = {}, prepared_statements: Tuple[str, ...] = ()
+    ) -> Union[Tuple, None]:
+        with self._connection() as connection:
+            self._prepare(connection, prepared_statements)
+            with connection.cursor() as cursor:
+                cursor.execute(command, data)
+                logger.debug("Starting query: %s", cursor.query)
+                entry = cursor.fetchone()
+                logger.debug("Finished query: %s", cursor.query)
+        logger.debug("%r", entry)
+        return entry
 
     def get_company(self, cnpj: str = "") -> Union[Company, None]:
         command = """
-        SELECT
-            *
-        FROM
-            resposta_cnpj
-        WHERE
-            estabelecimento_cnpj_basico = %(cnpj_basico)s
-            AND estabelecimento_cnpj_ordem = %(cnpj_ordem)s
-            AND estabelecimento_cnpj_dv = %(cnpj_dv)s
-        ;
+        EXECUTE get_company_stmt(%(cnpj_basico)s, %(cnpj_ordem)s, %(cnpj_dv)s);
         """
-        if not self._is_valid_cnpj(cnpj):
+        if not _is_valid_cnpj(cnpj):
             raise InvalidCNPJException(f'CNPJ "{cnpj}" is not valid.')
 
-        cnpj_basico, cnpj_ordem, cnpj_dv = self._split_cnpj(cnpj)
+        cnpj_only_digits, cnpj_basico, cnpj_ordem, cnpj_dv, _ = _canonicalize_cnpj(cnpj)
+        company = self._get_cached_company(cnpj_only_digits)
+        if company is not None:
+            return company
+
         data = {
             "cnpj_basico": cnpj_basico,
             "cnpj_ordem": cnpj_ordem,
             "cnpj_dv": cnpj_dv,
         }
-        result = list(self._select(command, data))
-        if result == []:
+        result = self._select_one(
+            command, data, prepared_statements=("get_company_stmt",)
+        )
+        if result is None:
+            # Not-found results are not cached, so a company added to the
+            # database shows up on the next lookup instead of after the TTL
             return None
 
-        return self._format_company_data(result[0], cnpj)
+        company = self._format_company_data(result, cnpj)
+        self._cache_company(cnpj_only_digits, company)
+        return company
+
+    def _get_cached_company(self, cnpj_only_digits: str) -> Union[Company, None]:
+        with self._company_cache_lock:
+            cached = self._company_cache.get(cnpj_only_digits)
+            if cached is None:
+                return None
+
+            expires_at, company = cached
+            if expires_at <= time.monotonic():
+                del self._company_cache[cnpj_only_digits]
+                return None
 
-    def get_partners(self, cnpj: str = "") -> Tuple[int, List[Partner]]:
+            self._company_cache.move_to_end(cnpj_only_digits)
+            return copy.copy(company)
+
+    def _cache_company(self, cnpj_only_digits: str, company: Company) -> None:
+        # Callers get their own copies, so changes made to a returned company
+        # (e.g. through the dict from vars()) never reach the cached entry
+        cached_company = copy.copy(company)
+        with self._company_cache_lock:
+            self._company_cache[cnpj_only_digits] = (
+                time.monotonic() + self._company_cache_ttl,
+                cached_company,
+            )
+            self._company_cache.move_to_end(cnpj_only_digits)
+            while len(self._company_cache) > self._company_cache_size:
+                self._company_cache.popitem(last=False)
+
+    def get_companies(self, cnpjs: List[str] = []) -> List[Union[Company, None]]:
+        # The key columns are selected again in front of "*" so each row can be
+        # matched back to the requested CNPJ without knowing the table layout
         command = """
         SELECT
+            estabelecimento_cnpj_basico,
+            estabelecimento_cnpj_ordem,
+            estabelecimento_cnpj_dv,
             *
         FROM
-            resposta_socios
+            resposta_cnpj
         WHERE
-            cnpj_basico = %(cnpj_basico)s
+            (
+                estabelecimento_cnpj_basico,
+                estabelecimento_cnpj_ordem,
+                estabelecimento_cnpj_dv
+            ) IN %(cnpjs)s
         ;
         """
-        if not self._is_valid_cnpj(cnpj):
+        for cnpj, is_valid in zip(cnpjs, _are_valid_cnpjs(cnpjs)):
+            if not is_valid:
+                raise InvalidCNPJException(f'CNPJ "{cnpj}" is not valid.')
+
+        if not cnpjs:
+            return []
+
+        data = {
+            "cnpjs": tuple({_split_cnpj(cnpj) for cnpj in cnpjs}),
+        }
+        results = {
+            _unsplit_cnpj(*result[:3]): result[3:]
+            for result in self._select(command, data)
+        }
+        companies = []
+        for cnpj in cnpjs:
+            result = results.get(_cnpj_only_digits(cnpj))
+            companies.append(
+                self._format_company_data(result, cnpj) if result is not None else None
+            )
+        return companies
+
+    def get_partners(self, cnpj: str = "") -> Tuple[int, Iterable[Partner]]:
+        command = """
+        EXECUTE get_partners_stmt(%(cnpj_basico)s);
+        """
+        if not _is_valid_cnpj(cnpj):
             raise InvalidCNPJException(f'CNPJ "{cnpj}" is not valid.')
 
-        cnpj_basico, *_ = self._split_cnpj(cnpj)
+        cnpj_basico, *_ = _split_cnpj(cnpj)
         data = {
             "cnpj_basico": cnpj_basico,
         }
-        results = list(self._select(command, data))
+        results = self._select_all(
+            command, data, prepared_statements=("get_partners_stmt",)
+        )
         return (
             len(results),
-            [self._format_partner_data(result, cnpj) for result in results],
+            (self._format_partner_data(result, cnpj) for result in results),
         )
 
     def _format_company_data(self, data: Tuple, cnpj: str) -> Company:
-        cnpj_only_digits = self._cnpj_only_digits(cnpj)
-        cnpj_basico, cnpj_ordem, cnpj_dv = self._split_cnpj(cnpj)
-        full_cnpj = self._format_full_cnpj(cnpj)
-        formatted_data = [self._always_str_or_none(value) for value in data]
+        (
+            cnpj_only_digits,
+            cnpj_basico,
+            cnpj_ordem,
+            cnpj_dv,
+            full_cnpj,
+        ) = _canonicalize_cnpj(cnpj)
         return Company(
-            cnpj_basico=cnpj_basico,
-            cnpj_ordem=cnpj_ordem,
-            cnpj_dv=cnpj_dv,
-            cnpj_completo=full_cnpj,
-            cnpj_completo_apenas_numeros=cnpj_only_digits,
-            identificador_matriz_filial=formatted_data[4],
-            nome_fantasia=formatted_data[5],
-            situacao_cadastral=formatted_data[6],
-            data_situacao_cadastral=formatted_data[7],
-            motivo_situacao_cadastral=formatted_data[8],
-            nome_cidade_exterior=formatted_data[9],
-            data_inicio_atividade=formatted_data[10],
-            cnae_fiscal_secundario=formatted_data[11],
-            tipo_logradouro=formatted_data[12],
-            logradouro=formatted_data[13],
-            numero=formatted_data[14],
-            complemento=formatted_data[15],
-            bairro=formatted_data[16],
-            cep=formatted_data[17],
-            uf=formatted_data[18],
-            ddd_telefone_1=formatted_data[19],
-            ddd_telefone_2=formatted_data[20],
-            ddd_telefone_fax=formatted_data[21],
-            correio_eletronico=formatted_data[22],
-            situacao_especial=formatted_data[23],
-            data_situacao_especial=formatted_data[24],
-            razao_social=formatted_data[25],
-            natureza_juridica=formatted_data[26],
-            qualificacao_do_responsavel=formatted_data[27],
-            capital_social=formatted_data[28],
-            porte=formatted_data[29],
-            ente_federativo_responsavel=formatted_data[30],
-            opcao_pelo_simples=formatted_data[31],
-            data_opcao_pelo_simples=formatted_data[32],
-            data_exclusao_pelo_simples=formatted_data[33],
-            opcao_pelo_mei=formatted_data[34],
-            data_opcao_pelo_mei=formatted_data[35],
-            data_exclusao_pelo_mei=formatted_data[36],
-            cnae=formatted_data[37],
-            pais=formatted_data[38],
-            municipio=formatted_data[39],
+            cnpj_basico,
+            cnpj_ordem,
+            cnpj_dv,
+            full_cnpj,
+            cnpj_only_digits,
+            *map(_always_str_or_none, _pick_company_columns(data)),
         )
 
     def _format_partner_data(self, data: Tuple, cnpj: str) -> Partner:
-        cnpj_only_digits = self._cnpj_only_digits(cnpj)
-        cnpj_basico, cnpj_ordem, cnpj_dv = self._split_cnpj(cnpj)
-        full_cnpj = self._format_full_cnpj(cnpj)
-        formatted_data = [self._always_str_or_none(value) for value in data]
+        (
+            cnpj_only_digits,
+            cnpj_basico,
+            cnpj_ordem,
+            cnpj_dv,
+            full_cnpj,
+        ) = _canonicalize_cnpj(cnpj)
         return Partner(
-            cnpj_basico=cnpj_basico,
-            cnpj_ordem=cnpj_ordem,
-            cnpj_dv=cnpj_dv,
-            cnpj_completo=full_cnpj,
-            cnpj_completo_apenas_numeros=cnpj_only_digits,
-            identificador_socio=formatted_data[2],
-            razao_social=formatted_data[3],
-            cnpj_cpf_socio=formatted_data[4],
-            qualificacao_socio=formatted_data[5],
-            data_entrada_sociedade=formatted_data[6],
-            pais_socio_estrangeiro=formatted_data[7],
-            numero_cpf_representante_legal=formatted_data[8],
-            nome_representante_legal=formatted_data[9],
-            qualificacao_representante_legal=formatted_data[10],
-            faixa_etaria=formatted_data[11],
-        )
-
-    def _always_str_or_none(self, data: Any) -> Union[str, None]:
-        if data == "None" or data == "" or data is None:
-            return None
-        elif not isinstance(data, str):
-            return str(data)
-        else:
-            return data
-
-    def _is_valid_cnpj(self, cnpj: str) -> bool:
-        cnpj_only_digits = self._cnpj_only_digits(cnpj)
-        if cnpj_only_digits == "" or len(cnpj_only_digits) > 14:
-            return False
-
-        cnpj_without_dv = cnpj_only_digits[:-2]
-        generated_dv = self._generate_cnpj_dv(cnpj_without_dv)
-        return cnpj_only_digits[-2:] == generated_dv
-
-    def _cnpj_only_digits(self, cnpj: str) -> str:
-        only_digits = re.sub(r"[^\d]", "", cnpj)
-        if only_digits == "":
-            return only_digits
-        else:
-            return only_digits.zfill(14)
-
-    def _generate_cnpj_dv(self, cnpj_without_dv: str) -> str:
-        first_digit = self._calculate_cnpj_dv_digit(cnpj_without_dv)
-        second_digit = self._calculate_cnpj_dv_digit(
-            cnpj_without_dv, first_digit=first_digit
-        )
-        return first_digit + second_digit
-
-    def _calculate_cnpj_dv_digit(
-        self, cnpj_without_dv: str, first_digit: str = ""
-    ) -> str:
-        weights = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
-        if first_digit == "":
-            weights = weights[1:]
-
-        cnpj_to_weight = cnpj_without_dv + first_digit
-        weighted_digits = [
-            int(num) * weight for num, weight in zip(cnpj_to_weight, weights)
-        ]
-        sum_remainder = sum(weighted_digits) % 11
-
-        if sum_remainder < 2:
-            return "0"
-        else:
-            return str(11 - sum_remainder)
-
-    def _format_full_cnpj(self, cnpj: str) -> str:
-        cnpj_only_digits = self._cnpj_only_digits(cnpj)
-        mask = "{}.{}.{}/{}-{}"
-        return mask.format(
-            cnpj_only_digits[:2],
-            cnpj_only_digits[2:5],
-            cnpj_only_digits[5:8],
-            cnpj_only_digits[8:12],
-            cnpj_only_digits[12:],
-        )
-
-    def _split_cnpj(self, cnpj: str) -> Tuple[str, str, str]:
-        cnpj_only_digits = self._cnpj_only_digits(cnpj)
-        return cnpj_only_digits[:8], cnpj_only_digits[8:12], cnpj_only_digits[12:]
-
-    def _unsplit_cnpj(self, cnpj_basico: str, cnpj_ordem: str, cnpj_dv: str) -> str:
-        mask = "{cnpj_basico}{cnpj_ordem}{cnpj_dv}"
-        return mask.format(
-            cnpj_basico=str(cnpj_basico).zfill(8),
-            cnpj_ordem=str(cnpj_ordem).zfill(4),
-            cnpj_dv=str(cnpj_dv).zfill(2),
+            cnpj_basico,
+            cnpj_ordem,
+            cnpj_dv,
+            full_cnpj,
+            cnpj_only_digits,
+            *map(_always_str_or_none, _pick_partner_columns(data)),
         )
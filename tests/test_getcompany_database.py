@@ -1,13 +1,26 @@
 import unittest
-from unittest.mock import MagicMock
-from database.postgresql import PostgreSQLDatabase, InvalidCNPJException, Company
+from unittest.mock import ANY, MagicMock, patch
+
+import psycopg2.extensions
+import psycopg2.pool
+
+from database.postgresql import (
+    PostgreSQLDatabase,
+    InvalidCNPJException,
+    Company,
+    _are_valid_cnpjs,
+    _format_full_cnpj,
+    _is_valid_cnpj,
+    _split_cnpj,
+)
 
 class TestGetCompany(unittest.TestCase):
 
     def setUp(self):
         self.db = PostgreSQLDatabase(host='localhost', database='testdb', user='user', password='pass', port=5432)
-        self.db._select = MagicMock()
-        self.db._format_company_data = MagicMock(return_value=Company())
+        self.db._select_one = MagicMock()
+        self.db._format_company_data = MagicMock(return_value=MagicMock(spec=Company))
+        self.addCleanup(self.db.close)
 
     def test_invalid_cnpj_empty(self):
         with self.assertRaises(InvalidCNPJException):
@@ -16,16 +29,214 @@ class TestGetCompany(unittest.TestCase):
     def test_invalid_cnpj_too_long(self):
         with self.assertRaises(InvalidCNPJException):
             self.db.get_company("123456789012345")
+        self.db._select_one.assert_not_called()
 
     def test_valid_cnpj_not_found(self):
-        self.db._select.return_value = []
-        result = self.db.get_company("12345678901234")
+        self.db._select_one.return_value = None
+        result = self.db.get_company("11222333000181")
         self.assertIsNone(result)
+        self.db._format_company_data.assert_not_called()
 
     def test_valid_cnpj_found(self):
-        self.db._select.return_value = [{}]
-        result = self.db.get_company("12345678901234")
+        self.db._select_one.return_value = ()
+        result = self.db.get_company("11.222.333/0001-81")
         self.assertIsInstance(result, Company)
+        self.db._select_one.assert_called_once_with(
+            ANY,
+            {"cnpj_basico": "11222333", "cnpj_ordem": "0001", "cnpj_dv": "81"},
+            prepared_statements=("get_company_stmt",),
+        )
+        self.db._format_company_data.assert_called_once_with((), "11.222.333/0001-81")
+
+class TestGetCompanies(unittest.TestCase):
+
+    def setUp(self):
+        self.db = PostgreSQLDatabase(host='localhost', database='testdb', user='user', password='pass', port=5432)
+        self.db._select = MagicMock(
+            return_value=[
+                ("11222333", "0001", "81", *range(40)),
+                ("11444777", "0001", "61", *range(100, 140)),
+            ]
+        )
+        self.addCleanup(self.db.close)
+
+    def test_results_follow_caller_order(self):
+        companies = self.db.get_companies(["11444777000161", "11.222.333/0001-81"])
+        self.assertEqual(
+            [company.cnpj_completo for company in companies],
+            ["11.444.777/0001-61", "11.222.333/0001-81"],
+        )
+        self.assertEqual(companies[0].identificador_matriz_filial, "104")
+        self.assertEqual(companies[1].identificador_matriz_filial, "4")
+        self.assertEqual(companies[1].municipio, "39")
+
+    def test_duplicate_cnpjs_are_queried_once(self):
+        companies = self.db.get_companies(["11222333000181", "11.222.333/0001-81"])
+        self.assertEqual(len(companies), 2)
+        self.assertEqual(companies[0], companies[1])
+        _, data = self.db._select.call_args.args
+        self.assertEqual(data["cnpjs"], (("11222333", "0001", "81"),))
+
+    def test_missing_cnpj_returns_none(self):
+        companies = self.db.get_companies(["11222333000181", "11.111.111/0001-91"])
+        self.assertEqual(companies[0].cnpj_completo, "11.222.333/0001-81")
+        self.assertIsNone(companies[1])
+
+    def test_invalid_cnpj_raises(self):
+        with self.assertRaises(InvalidCNPJException):
+            self.db.get_companies(["11222333000181", "11.222.333/0001-82"])
+        self.db._select.assert_not_called()
+
+    def test_empty_list_does_not_query(self):
+        self.assertEqual(self.db.get_companies([]), [])
+        self.db._select.assert_not_called()
+
+class TestGetPartners(unittest.TestCase):
+
+    def setUp(self):
+        self.db = PostgreSQLDatabase(host='localhost', database='testdb', user='user', password='pass', port=5432)
+        self.db._select_all = MagicMock(return_value=[tuple(range(12)), tuple(range(100, 112))])
+        self.addCleanup(self.db.close)
+
+    def test_partners_are_counted_and_formatted(self):
+        total, partners = self.db.get_partners("11.222.333/0001-81")
+        self.assertEqual(total, 2)
+        partners = list(partners)
+        self.assertEqual([partner.identificador_socio for partner in partners], ["2", "102"])
+        self.assertEqual(partners[0].cnpj_completo, "11.222.333/0001-81")
+        self.db._select_all.assert_called_once_with(
+            ANY, {"cnpj_basico": "11222333"}, prepared_statements=("get_partners_stmt",)
+        )
+
+    def test_invalid_cnpj_raises(self):
+        with self.assertRaises(InvalidCNPJException):
+            self.db.get_partners("11.222.333/0001-82")
+        self.db._select_all.assert_not_called()
+
+def fake_connection():
+    connection = MagicMock()
+    connection.closed = 0
+    connection.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    connection.cursor.return_value.__enter__.return_value.fetchone.return_value = None
+    return connection
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.db = PostgreSQLDatabase(host='localhost', database='pooldb', user='user', password='pass', port=5432)
+        self.addCleanup(self.db.close)
+
+    @patch("psycopg2.connect", side_effect=lambda *args, **kwargs: fake_connection())
+    def test_no_connection_before_first_query(self, connect):
+        db = PostgreSQLDatabase(host='localhost', database='lazydb', user='user', password='pass', port=5432)
+        self.addCleanup(db.close)
+        connect.assert_not_called()
+        self.assertNotIn(db._pool_key, PostgreSQLDatabase._pools)
+
+    @patch("psycopg2.connect", side_effect=lambda *args, **kwargs: fake_connection())
+    def test_connection_is_reused_between_queries(self, connect):
+        self.db._select_one("SELECT 1;")
+        self.db._select_one("SELECT 1;")
+        connect.assert_called_once()
+
+    def test_connection_is_discarded_after_an_error(self):
+        broken, healthy = fake_connection(), fake_connection()
+        broken_cursor = broken.cursor.return_value.__enter__.return_value
+        broken_cursor.execute.side_effect = psycopg2.Error("prepared statement already exists")
+        with patch("psycopg2.connect", side_effect=[broken, healthy]) as connect:
+            with self.assertRaises(psycopg2.Error):
+                self.db._select_one("SELECT 1;", prepared_statements=("get_company_stmt",))
+            broken.close.assert_called_once()
+            self.db._select_one("SELECT 1;", prepared_statements=("get_company_stmt",))
+            self.assertEqual(connect.call_count, 2)
+            healthy.close.assert_not_called()
+
+    @patch("psycopg2.connect", side_effect=lambda *args, **kwargs: fake_connection())
+    def test_gateways_with_same_settings_share_a_pool(self, connect):
+        other = PostgreSQLDatabase(host='localhost', database='pooldb', user='user', password='pass', port=5432)
+        self.addCleanup(other.close)
+        self.db._select_one("SELECT 1;")
+        other._select_one("SELECT 1;")
+        connect.assert_called_once()
+        self.assertIs(self.db._get_pool(), other._get_pool())
+
+    @patch("psycopg2.connect", side_effect=lambda *args, **kwargs: fake_connection())
+    def test_pool_sizes_are_part_of_the_pool_key(self, connect):
+        other = PostgreSQLDatabase(host='localhost', database='pooldb', user='user', password='pass', port=5432, max_connections=2)
+        self.addCleanup(other.close)
+        self.assertIsNot(self.db._get_pool(), other._get_pool())
+        self.assertEqual(other._get_pool().maxconn, 2)
+
+    @patch("psycopg2.connect", side_effect=lambda *args, **kwargs: fake_connection())
+    def test_pool_stays_open_until_last_gateway_closes(self, connect):
+        other = PostgreSQLDatabase(host='localhost', database='pooldb', user='user', password='pass', port=5432)
+        self.addCleanup(other.close)
+        pool = other._get_pool()
+        self.db.close()
+        other._select_one("SELECT 1;")
+        self.assertFalse(pool.closed)
+        with self.assertRaises(psycopg2.pool.PoolError):
+            self.db._select_one("SELECT 1;")
+        other.close()
+        self.assertTrue(pool.closed)
+
+class TestCompanyCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db = PostgreSQLDatabase(host='localhost', database='testdb', user='user', password='pass', port=5432)
+        self.addCleanup(self.db.close)
+        self.db._select_one = MagicMock(return_value=())
+        self.db._format_company_data = MagicMock(return_value="company")
+
+    def test_repeated_lookup_is_served_from_cache(self):
+        self.assertEqual(self.db.get_company("11.222.333/0001-81"), "company")
+        self.assertEqual(self.db.get_company("11222333000181"), "company")
+        self.db._select_one.assert_called_once()
+
+    def test_expired_entry_is_fetched_again(self):
+        self.db._company_cache_ttl = 0
+        self.db.get_company("11222333000181")
+        self.db.get_company("11222333000181")
+        self.assertEqual(self.db._select_one.call_count, 2)
+
+    def test_changes_to_returned_company_do_not_reach_cache(self):
+        self.db._select_one.return_value = tuple(range(40))
+        del self.db._format_company_data
+        company = self.db.get_company("11222333000181")
+        vars(company)["nome_fantasia"] = "changed"
+        cached = self.db.get_company("11222333000181")
+        self.assertEqual(cached.nome_fantasia, "5")
+        vars(cached)["nome_fantasia"] = "changed again"
+        self.assertEqual(self.db.get_company("11222333000181").nome_fantasia, "5")
+        self.db._select_one.assert_called_once()
+
+    def test_not_found_lookup_is_not_cached(self):
+        self.db._select_one.return_value = None
+        self.assertIsNone(self.db.get_company("11222333000181"))
+        self.assertIsNone(self.db.get_company("11222333000181"))
+        self.assertEqual(self.db._select_one.call_count, 2)
+        self.db._format_company_data.assert_not_called()
+
+class TestCNPJHelpers(unittest.TestCase):
+
+    def test_valid_cnpj(self):
+        self.assertTrue(_is_valid_cnpj("11.222.333/0001-81"))
+        self.assertTrue(_is_valid_cnpj("11222333000181"))
+
+    def test_invalid_cnpj(self):
+        self.assertFalse(_is_valid_cnpj(""))
+        self.assertFalse(_is_valid_cnpj("11.222.333/0001-82"))
+        self.assertFalse(_is_valid_cnpj("123456789012345"))
+
+    def test_validate_many_cnpjs(self):
+        self.assertEqual(
+            _are_valid_cnpjs(["11.222.333/0001-81", "11.222.333/0001-82", ""]),
+            [True, False, False],
+        )
+
+    def test_split_and_format_cnpj(self):
+        self.assertEqual(_split_cnpj("11.222.333/0001-81"), ("11222333", "0001", "81"))
+        self.assertEqual(_format_full_cnpj("11222333000181"), "11.222.333/0001-81")
 
 if __name__ == '__main__':
     unittest.main()